@@ -0,0 +1,236 @@
+import math
+
+import numpy as np
+
+
+class PolyphaseResampler:
+    """
+    Потоковий ресемплер з раціональним коефіцієнтом L/M (віконний sinc, поліфазна реалізація).
+    Зберігає історію між чанками, тому стики між порціями даних не чутні.
+    """
+
+    def __init__(self, in_rate, out_rate, max_in_frames, taps_per_phase=32):
+        g = math.gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // g
+        self.down = int(in_rate) // g
+        self.taps = taps_per_phase
+        self.passthrough = self.up == self.down
+
+        # Прототип ФНЧ: зріз по меншій з частот Найквіста, вікно Кайзера
+        n = self.up * self.taps
+        cutoff = 0.95 / max(self.up, self.down)
+        t = np.arange(n, dtype=np.float64) - (n - 1) / 2.0
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(n, 8.6)
+        h *= self.up / h.sum()
+        # Банк фаз: bank[p, k] = h[p + k * L]; розвертаємо по k, щоб множити на x[base - taps + 1 .. base]
+        self.bank = np.ascontiguousarray(h.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+
+        # Максимальна кількість вихідних семплів на чанк
+        self.max_out_frames = (max_in_frames * self.up) // self.down + 2
+
+        # Буфер: історія (taps - 1) + поточний чанк
+        self._hist = self.taps - 1
+        self._buf = np.zeros(self._hist + max_in_frames, dtype=np.float32)
+        # Позиція наступного вихідного семплу у "підвищеній" шкалі відносно початку чанка
+        self._t = 0
+
+        # View з ковзними вікнами довжини taps поверх буфера (без копіювання)
+        self._windows = np.lib.stride_tricks.sliding_window_view(self._buf, self.taps)
+        self._pos = np.empty(self.max_out_frames, dtype=np.intp)
+        self._base = np.empty(self.max_out_frames, dtype=np.intp)
+        self._phase = np.empty(self.max_out_frames, dtype=np.intp)
+        self._gathered = np.empty((self.max_out_frames, self.taps), dtype=np.float32)
+        self._coeffs = np.empty((self.max_out_frames, self.taps), dtype=np.float32)
+        self._out = np.empty(self.max_out_frames, dtype=np.float32)
+        self._step = np.arange(self.max_out_frames, dtype=np.intp) * self.down
+
+    def reset(self):
+        self._buf[:self._hist] = 0.0
+        self._t = 0
+
+    def process(self, samples):
+        """Приймає float32 моно-масив, повертає view на внутрішній буфер з результатом."""
+        if self.passthrough:
+            return samples
+
+        n = samples.shape[0]
+        hist = self._hist
+        self._buf[hist:hist + n] = samples
+
+        limit = n * self.up
+        if self._t >= limit:
+            count = 0
+        else:
+            count = (limit - self._t + self.down - 1) // self.down
+
+        if count:
+            pos = self._pos[:count]
+            np.add(self._step[:count], self._t, out=pos)
+            base = self._base[:count]
+            phase = self._phase[:count]
+            np.floor_divide(pos, self.up, out=base)
+            np.remainder(pos, self.up, out=phase)
+
+            # Вікно буфера base .. base + taps - 1 (з урахуванням зсуву історії)
+            gathered = self._gathered[:count]
+            np.take(self._windows, base, axis=0, out=gathered)
+            coeffs = self._coeffs[:count]
+            np.take(self.bank, phase, axis=0, out=coeffs)
+            np.einsum('ij,ij->i', gathered, coeffs, out=self._out[:count])
+
+        self._t += count * self.down - limit
+        # Зберігаємо хвіст як історію для наступного чанка
+        self._buf[:hist] = self._buf[n:n + hist]
+        return self._out[:count]
+
+
+class AudioProcessor:
+    """
+    Векторизована обробка аудіо по чанках: int16 -> float, гейн/лімітер,
+    шумовий гейт, ресемплінг до частоти пристрою та розкладка по каналах.
+    Багатоканальний вхід зводиться в моно на самому початку.
+    Усі робочі буфери виділяються один раз у конструкторі.
+    """
+
+    def __init__(self, in_rate=44100, out_rate=44100, out_channels=1, max_in_frames=1024, in_channels=1):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.in_channels = max(1, int(in_channels))
+        self.out_channels = max(1, int(out_channels))
+        self.max_in_frames = max_in_frames
+
+        # Параметри, які можна змінювати на льоту
+        self.gain_db = 0.0
+        self.limiter_ceiling = 0.98
+        self.limiter_release = 0.9       # Частка зменшення редукції за чанк
+        self.gate_enabled = False
+        self.gate_threshold_db = -50.0
+        self.gate_release = 0.5          # Множник гейту за чанк при закритті
+
+        # Стан гейну між чанками (для плавної зміни без клацань)
+        self._current_gain = 1.0
+        self._limiter_gain = 1.0
+        self._gate_gain = 1.0
+
+        # Залишок неповного кадру (семпл усіх каналів) з попереднього recv
+        self._frame_bytes = 2 * self.in_channels
+        self._carry = bytearray()
+        self._pending = bytearray(self._frame_bytes * (max_in_frames + 1))
+
+        self._float_in = np.empty(max_in_frames + 1, dtype=np.float32)
+        self._ramp = np.empty(max_in_frames + 1, dtype=np.float32)
+        self._ramp_base = np.linspace(0.0, 1.0, max_in_frames + 1, dtype=np.float32)
+        self._abs = np.empty(max_in_frames + 1, dtype=np.float32)
+
+        self.resampler = PolyphaseResampler(self.in_rate, self.out_rate, max_in_frames + 1)
+        max_out = self.resampler.max_out_frames if not self.resampler.passthrough else max_in_frames + 1
+        self._out_float = np.empty((max_out, self.out_channels), dtype=np.float32)
+        self._out_int = np.empty((max_out, self.out_channels), dtype=np.int16)
+
+    def reset(self):
+        self._carry.clear()
+        self._current_gain = 1.0
+        self._limiter_gain = 1.0
+        self._gate_gain = 1.0
+        self.resampler.reset()
+
+    def process(self, data):
+        """
+        Обробляє сирі байти PCM16 (in_channels каналів, до max_in_frames кадрів) з сокета.
+        Повертає bytes, готові для stream.write (може бути порожнім).
+        """
+        # Вирівнювання по кадрах: recv може розрізати семпл або кадр навпіл
+        if self._carry:
+            carried = len(self._carry)
+            total = carried + len(data)
+            self._pending[0:carried] = self._carry
+            self._pending[carried:total] = data
+            source = self._pending
+        else:
+            total = len(data)
+            source = data
+
+        usable = total - (total % self._frame_bytes)
+        if usable < total:
+            self._carry[:] = source[usable:total]
+        else:
+            self._carry.clear()
+
+        raw = np.frombuffer(source, dtype=np.int16, count=usable // 2)
+        n = raw.shape[0] // self.in_channels
+        if n == 0:
+            return b''
+
+        x = self._float_in[:n]
+        if self.in_channels == 1:
+            np.multiply(raw, 1.0 / 32768.0, out=x, casting='unsafe')
+        else:
+            # Зведення в моно: середнє по каналах
+            np.sum(raw.reshape(n, self.in_channels), axis=1, dtype=np.float32, out=x)
+            np.multiply(x, 1.0 / (32768.0 * self.in_channels), out=x)
+
+        self._apply_gain(x)
+
+        y = self.resampler.process(x)
+        m = y.shape[0]
+        if m == 0:
+            return b''
+
+        # Розкладка по каналах (моно -> N каналів через broadcasting)
+        out = self._out_float[:m]
+        out[:] = y[:, None]
+
+        out_i = self._out_int[:m]
+        np.multiply(out, 32767.0, out=out)
+        np.clip(out, -32768.0, 32767.0, out=out)
+        np.copyto(out_i, out, casting='unsafe')
+        return out_i.tobytes()
+
+    def _apply_gain(self, x):
+        n = x.shape[0]
+        user_gain = 10.0 ** (self.gain_db / 20.0)
+
+        absx = self._abs[:n]
+        np.abs(x, out=absx)
+        peak = float(absx.max())
+
+        # Шумовий гейт: порівнюємо RMS чанка з порогом
+        if self.gate_enabled:
+            rms = math.sqrt(float(np.dot(x, x)) / n)
+            level_db = 20.0 * math.log10(rms) if rms > 1e-9 else -120.0
+            if level_db >= self.gate_threshold_db:
+                self._gate_gain = 1.0
+            else:
+                self._gate_gain *= self.gate_release
+                if self._gate_gain < 1e-3:
+                    self._gate_gain = 0.0
+        else:
+            self._gate_gain = 1.0
+
+        # Лімітер: миттєва атака, поступове відновлення
+        needed = 1.0
+        if peak * user_gain > self.limiter_ceiling:
+            needed = self.limiter_ceiling / (peak * user_gain)
+        if needed < self._limiter_gain:
+            self._limiter_gain = needed
+        else:
+            self._limiter_gain = min(needed, 1.0 - (1.0 - self._limiter_gain) * self.limiter_release)
+
+        limit = user_gain * self._limiter_gain
+        target = limit * self._gate_gain
+        # Атака лімітера миттєва: гейн чанка ніколи не перевищує limit, плавно лише відновлюється
+        start = min(self._current_gain, limit)
+
+        if target == start:
+            if target != 1.0:
+                np.multiply(x, target, out=x)
+        else:
+            # Лінійна рампа від попереднього гейну до нового в межах чанка
+            ramp = self._ramp[:n]
+            np.multiply(self._ramp_base[:n], (target - start) * (self.max_in_frames / max(n - 1, 1)), out=ramp)
+            np.add(ramp, start, out=ramp)
+            np.multiply(x, ramp, out=x)
+        self._current_gain = target
+
+        # Захист від перевищення після рампи
+        np.clip(x, -1.0, 1.0, out=x)
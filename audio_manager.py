@@ -1,18 +1,32 @@
-import socket
 import threading
 import time
 
+from stream_protocol import AudioStreamClient, AUDIO_CODEC_PCM, AUDIO_CODEC_OPUS
+from tracing import tracer
+
 try:
     import pyaudio
 except ImportError:
     pyaudio = None
 
+# opuslib кидає звичайний Exception, якщо не знайдено системну бібліотеку libopus
+try:
+    import opuslib
+except Exception:
+    opuslib = None
+
+try:
+    from audio_dsp import AudioProcessor
+except ImportError:
+    AudioProcessor = None
+    print("Warning: numpy not installed. Audio DSP disabled, raw PCM passthrough.")
+
 
 class AudioManager:
     def __init__(self):
         self.running = False
         self.thread = None
-        self.socket = None
+        self.client = None
 
         # Налаштування аудіо (16 bit, Mono, 44100 Hz)
         self.sample_rate = 44100
@@ -23,6 +37,31 @@ class AudioManager:
         self.pa = None
         self.stream = None
 
+        # Параметри пристрою виводу (визначаються при відкритті потоку)
+        self.output_rate = self.sample_rate
+        self.output_channels = self.channels
+        self.processor = None
+
+        # Налаштування обробки, які зберігаються між перепідключеннями
+        self.gain_db = 0.0
+        self.gate_enabled = False
+        self.gate_threshold_db = -50.0
+
+        # Opus: пропонуємо телефону, якщо є декодер і ресемплер (Opus завжди 48 кГц)
+        self.opus_enabled = True
+        self.opus_max_frame = 5760       # 120 мс при 48 кГц - найбільший кадр Opus
+        self.max_conceal_frames = 5      # Скільки кадрів поспіль можна маскувати
+        self.underrun_margin = 0.01      # Маскуємо, коли у виході лишилось менше цього запасу, с
+        self.late_play_threshold = 0.06  # Запізнілий пакет ще граємо, поки у виході менше цього, с
+        self.silence_timeout = 3.0       # Без жодного пакета стільки секунд - перепідключаємось
+        self._last_packet_time = 0.0
+        self._output_capacity = 0
+        self.decoder = None
+        self.input_channels = self.channels
+        self._expected_seq = None
+        self._concealed = 0
+        self._last_frame_samples = 960
+
         self.target_host = "127.0.0.1"
         self.target_port = 8555
 
@@ -39,7 +78,7 @@ class AudioManager:
         self.running = True
 
         print(f"[AudioMgr] Starting thread for {self.target_host}:{self.target_port}")
-        self.thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.thread = threading.Thread(target=self._worker_loop, name="AudioWorker", daemon=True)
         self.thread.start()
 
     def stop(self):
@@ -49,6 +88,19 @@ class AudioManager:
         self._close_audio_stream()
         print("[AudioMgr] Stopped")
 
+    def set_gain(self, gain_db):
+        self.gain_db = float(gain_db)
+        if self.processor:
+            self.processor.gain_db = self.gain_db
+
+    def set_noise_gate(self, enabled, threshold_db=None):
+        self.gate_enabled = bool(enabled)
+        if threshold_db is not None:
+            self.gate_threshold_db = float(threshold_db)
+        if self.processor:
+            self.processor.gate_enabled = self.gate_enabled
+            self.processor.gate_threshold_db = self.gate_threshold_db
+
     def _init_audio_stream(self):
         if not self.running: return
 
@@ -57,6 +109,7 @@ class AudioManager:
 
             output_device_index = None
             found_cable = False
+            dev_info = None
 
             # Пошук пристрою "CABLE Input"
             info = self.pa.get_host_api_info_by_index(0)
@@ -79,16 +132,27 @@ class AudioManager:
                 self.stream = None
                 return
 
+            # Працюємо на рідній частоті та кількості каналів пристрою, щоб уникнути помилок формату
+            if AudioProcessor is not None:
+                self.output_rate = int(dev_info.get('defaultSampleRate') or self.sample_rate)
+                self.output_channels = min(int(dev_info.get('maxOutputChannels')), 2)
+                self._create_processor(self.sample_rate)
+            else:
+                self.output_rate = self.sample_rate
+                self.output_channels = self.channels
+
             # Відкриваємо потік тільки якщо знайшли кабель
             self.stream = self.pa.open(
                 format=self.format,
-                channels=self.channels,
-                rate=self.sample_rate,
+                channels=self.output_channels,
+                rate=self.output_rate,
                 output=True,
                 output_device_index=output_device_index,
                 frames_per_buffer=self.chunk_size
             )
-            print("[AudioMgr] Audio stream opened successfully.")
+            # Відразу після відкриття буфер порожній: вільне місце = його повна місткість
+            self._output_capacity = self.stream.get_write_available()
+            print(f"[AudioMgr] Audio stream opened successfully ({self.output_rate} Hz, {self.output_channels} ch).")
 
         except Exception as e:
             print(f"[AudioMgr] Init failed: {e}")
@@ -108,6 +172,156 @@ class AudioManager:
                 pass
         self.stream = None
         self.pa = None
+        self.processor = None
+
+    def _create_processor(self, in_rate, in_channels=1):
+        self.processor = AudioProcessor(
+            in_rate=in_rate,
+            out_rate=self.output_rate,
+            out_channels=self.output_channels,
+            max_in_frames=self.chunk_size,
+            in_channels=in_channels
+        )
+        self.processor.gain_db = self.gain_db
+        self.processor.gate_enabled = self.gate_enabled
+        self.processor.gate_threshold_db = self.gate_threshold_db
+
+    def _can_use_opus(self):
+        return self.opus_enabled and opuslib is not None and self.processor is not None
+
+    def _on_connected(self, client):
+        preferred = AUDIO_CODEC_OPUS if self._can_use_opus() else AUDIO_CODEC_PCM
+        codec = client.negotiate(preferred)
+
+        self.decoder = None
+        if codec == AUDIO_CODEC_OPUS:
+            try:
+                if not self._can_use_opus():
+                    raise RuntimeError("Opus was not offered")
+                # Декодер Opus з одним каналом сам зводить стерео-потік у моно
+                self.decoder = opuslib.Decoder(client.sample_rate, 1)
+            except Exception as e:
+                # Як і для некоректної відповіді, лишаємось на PCM замість нескінченних перепідключень
+                print(f"[AudioMgr] Cannot decode Opus ({e}), falling back to PCM")
+                client.codec = AUDIO_CODEC_PCM
+                client.sample_rate = self.sample_rate
+                client.channels = self.channels
+
+        self.input_channels = client.channels
+        if self.decoder:
+            self.input_channels = 1
+            self._expected_seq = None
+            self._concealed = 0
+            self._last_packet_time = time.monotonic()
+            self._last_frame_samples = client.sample_rate // 50
+
+        # Частота вхідного потоку могла змінитись після узгодження
+        if self.processor:
+            if (self.processor.in_rate, self.processor.in_channels) != (client.sample_rate, self.input_channels):
+                self._create_processor(client.sample_rate, self.input_channels)
+            else:
+                self.processor.reset()
+        elif self.stream and self.input_channels != self.output_channels:
+            print("[AudioMgr] Multichannel PCM needs numpy for downmix. Audio playback will be DISABLED.")
+
+        name = "Opus" if self.decoder else "PCM"
+        print(f"[AudioMgr] Connected to phone audio port {self.target_port} "
+              f"({name}, {client.sample_rate} Hz, {client.channels} ch)")
+
+    def _play(self, pcm):
+        # Якщо потік відкритий, Cable знайдено - граємо.
+        # Якщо ні - дропаємо, але продовжуємо читати, щоб буфер TCP не переповнився і додаток не завис.
+        if not self.stream:
+            return
+        if not self.processor:
+            if self.input_channels == self.output_channels:
+                with tracer.span("stream_write"):
+                    self.stream.write(pcm)
+            return
+
+        # Процесор розрахований на порції до chunk_size кадрів
+        step = self.chunk_size * 2 * self.input_channels
+        for offset in range(0, len(pcm), step):
+            with tracer.span("audio_dsp"):
+                data = self.processor.process(pcm[offset:offset + step])
+            if data:
+                with tracer.span("stream_write"):
+                    self.stream.write(data)
+
+    def _conceal(self, count):
+        """Packet loss concealment: декодер Opus домальовує пропущені кадри."""
+        tracer.instant("audio_conceal", args={'frames': count})
+        for _ in range(min(count, self.max_conceal_frames)):
+            self._play(self.decoder.decode(b'', self._last_frame_samples))
+
+    def _buffered_output(self):
+        """Скільки секунд звуку ще чекає у буфері PortAudio (None, якщо виводу немає)."""
+        if not self.stream or not self._output_capacity:
+            return None
+        try:
+            free = self.stream.get_write_available()
+        except Exception:
+            return None
+        return max(self._output_capacity - free, 0) / self.output_rate
+
+    def _receive_opus(self, client):
+        # TCP доставляє пакети із запізненням, але цілими. Тому чекаємо, поки у виході є звук,
+        # і маскуємо лише тоді, коли буфер PortAudio от-от спорожніє.
+        # Якщо пакетів немає довше за silence_timeout, з'єднання вважаємо втраченим.
+        buffered = self._buffered_output()
+        silence_left = self.silence_timeout - (time.monotonic() - self._last_packet_time)
+        can_conceal = (buffered is not None and self._expected_seq is not None
+                       and self._concealed < self.max_conceal_frames)
+        if can_conceal:
+            timeout = min(max(buffered - self.underrun_margin, 0.002), silence_left)
+        else:
+            # Маскувати нічого або вже досить - просто чекаємо наступного пакета
+            timeout = silence_left
+
+        packet = None
+        if timeout > 0:
+            with tracer.span("audio_recv"):
+                packet = client.read_opus_packet(timeout=timeout)
+        if packet is None:
+            if time.monotonic() - self._last_packet_time >= self.silence_timeout:
+                raise TimeoutError("Audio timeout")
+            if can_conceal:
+                self._conceal(1)
+                self._concealed += 1
+            return
+        self._last_packet_time = time.monotonic()
+
+        seq, payload = packet
+        missing = 0
+        if self._expected_seq is not None:
+            missing = (seq - self._expected_seq) & 0xFFFF
+            if missing >= 0x8000:
+                # Застарілий або дубльований пакет
+                return
+
+        # Частину пропусків уже замасковано, поки пакет запізнювався
+        covered = min(missing, self._concealed)
+        missing -= covered
+        self._concealed -= covered
+        if missing:
+            self._conceal(missing)
+
+        with tracer.span("opus_decode"):
+            pcm = self.decoder.decode(payload, self.opus_max_frame)
+        samples = len(pcm) // 2
+        if samples:
+            self._last_frame_samples = samples
+
+        if self._concealed:
+            self._concealed -= 1
+            # Запізнілий пакет, чий час уже заповнено маскуванням. Якщо у виході мало звуку,
+            # він ще встигає зіграти; інакше лише оновлюємо стан декодера, щоб не накопичувати затримку.
+            buffered = self._buffered_output()
+            if buffered is not None and buffered < self.late_play_threshold:
+                self._play(pcm)
+        else:
+            self._play(pcm)
+        self._expected_seq = (seq + 1) & 0xFFFF
 
     def _worker_loop(self):
         # Ініціалізація
@@ -115,43 +329,37 @@ class AudioManager:
 
         while self.running:
             # Підключення до телефону
-            if self.socket is None:
+            if self.client is None:
+                client = AudioStreamClient(self.target_host, self.target_port, self.sample_rate, self.channels)
+                if not client.connect():
+                    time.sleep(1.0)
+                    continue
                 try:
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    sock.settimeout(2.0)
-                    sock.connect((self.target_host, self.target_port))
-                    self.socket = sock
-                    print(f"[AudioMgr] Connected to phone audio port {self.target_port}")
-                except Exception:
+                    self._on_connected(client)
+                    self.client = client
+                except Exception as e:
+                    print(f"[AudioMgr] Negotiation failed: {e}")
+                    client.close()
                     time.sleep(1.0)
                     continue
 
             # Читання даних
             try:
-                # Читаємо порцію даних
-                # *2 тому що 16-бітний звук це 2 байти на семпл
-                data = self.socket.recv(self.chunk_size * 2)
-
-                if not data:
-                    raise ConnectionResetError("No data")
-
-                #мЯкщо потік відкритий, Cable знайдено - граємо.
-                # Якщо ні -дропаємо, але продовжуємо читати, щоб буфер TCP не переповнився і додаток не завис.
-                if self.stream:
-                    self.stream.write(data)
+                if self.decoder:
+                    self._receive_opus(self.client)
+                else:
+                    # *2 тому що 16-бітний звук це 2 байти на семпл
+                    with tracer.span("audio_recv"):
+                        data = self.client.read_pcm(self.chunk_size * 2 * self.input_channels)
+                    self._play(data)
 
             except Exception as e:
-                if self.socket:
-                    try:
-                        self.socket.close()
-                    except:
-                        pass
-                self.socket = None
+                self.client.close()
+                self.client = None
+                self.decoder = None
                 time.sleep(0.5)
 
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-                pass
-        self._close_audio_stream()
\ No newline at end of file
+        if self.client:
+            self.client.close()
+            self.client = None
+        self._close_audio_stream()
@@ -0,0 +1,271 @@
+import struct
+import threading
+import time
+from collections import deque
+
+import cv2
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class Frame:
+    """
+    Кадр, що розсилається підписникам. Зображення доступне лише для читання
+    і спільне для всіх підписників з однаковим запитом, тож його не можна змінювати.
+    Пам'ять звільняється, коли останній підписник відпускає посилання.
+    """
+    __slots__ = ('frame_id', 'timestamp', 'image')
+
+    def __init__(self, frame_id, timestamp, image):
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.image = image
+
+
+class Subscription:
+    """
+    Черга кадрів одного підписника. Переповнення відкидає найстаріший кадр,
+    тож повільний підписник ніколи не гальмує інших.
+    """
+
+    def __init__(self, bus, name, fmt, width, height, content_only, max_fps, queue_size):
+        self.bus = bus
+        self.name = name
+        self.fmt = fmt
+        self.width = width
+        self.height = height
+        self.content_only = content_only
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.dropped = 0
+
+        self._queue = deque(maxlen=max(1, queue_size))
+        self._cond = threading.Condition()
+        self._last_sent = 0.0
+        self.closed = False
+
+    @property
+    def key(self):
+        return self.fmt, self.width, self.height, self.content_only
+
+    def get(self, timeout=None):
+        """Повертає найстаріший кадр з черги або None після таймауту / закриття."""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            if self._queue:
+                return self._queue.popleft()
+        return None
+
+    def get_latest(self):
+        """Не блокує: повертає найновіший кадр, відкидаючи решту."""
+        with self._cond:
+            if not self._queue:
+                return None
+            frame = self._queue.pop()
+            self.dropped += len(self._queue)
+            self._queue.clear()
+            return frame
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def _is_due(self, now):
+        return now - self._last_sent >= self.min_interval
+
+    def _push(self, frame, now):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(frame)
+            self._last_sent = now
+            self._cond.notify()
+
+    def _wake(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class FrameBus:
+    """
+    Розсилка декодованих кадрів кільком споживачам.
+    Кожне перетворення (розмір, формат, область) рахується один раз на кадр
+    для всіх підписників з однаковим запитом.
+    """
+
+    FORMATS = ('bgr', 'rgb', 'gray')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+
+    def subscribe(self, name, fmt='bgr', width=None, height=None, content_only=False,
+                  max_fps=None, queue_size=1):
+        """
+        fmt - 'bgr', 'rgb' або 'gray'; width/height - розмір (None - як у джерела);
+        content_only - лише область кадру без чорних смуг letterbox.
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported frame format: {fmt}")
+        sub = Subscription(self, name, fmt, width, height, content_only, max_fps, queue_size)
+        with self.lock:
+            self.subscriptions = self.subscriptions + [sub]
+        size = f"{width}x{height}" if width and height else "source size"
+        print(f"[FrameBus] Subscribed '{name}' ({fmt}, {size})")
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not sub]
+        sub._wake()
+
+    def publish(self, canvas, content_rect, frame_id):
+        """
+        canvas - BGR кадр (буфер може бути перезаписаний після повернення),
+        content_rect - (x, y, w, h) області без смуг.
+        """
+        subscriptions = self.subscriptions
+        if not subscriptions:
+            return
+
+        now = time.monotonic()
+        due = [s for s in subscriptions if s._is_due(now)]
+        if not due:
+            return
+
+        converted = {}
+        for sub in due:
+            key = sub.key
+            frame = converted.get(key)
+            if frame is None:
+                image = self._convert(canvas, content_rect, *key)
+                image.flags.writeable = False
+                frame = Frame(frame_id, now, image)
+                converted[key] = frame
+            sub._push(frame, now)
+
+    @staticmethod
+    def _convert(canvas, content_rect, fmt, width, height, content_only):
+        src = canvas
+        if content_only:
+            x, y, w, h = content_rect
+            src = canvas[y:y + h, x:x + w]
+
+        if width and height and (src.shape[1], src.shape[0]) != (width, height):
+            # resize завжди повертає новий буфер, тож копія canvas не потрібна
+            src = cv2.resize(src, (width, height), interpolation=cv2.INTER_AREA)
+            owned = True
+        else:
+            owned = False
+
+        if fmt == 'rgb':
+            return cv2.cvtColor(src, cv2.COLOR_BGR2RGB)
+        if fmt == 'gray':
+            return cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+        return src if owned else src.copy()
+
+
+class SharedMemoryRing:
+    """
+    Підписник, що пише кадри в кільцевий буфер shared memory для інших локальних процесів.
+
+    Розмітка: заголовок '<QIIII' (seq, width, height, channels, slots),
+    далі slots слотів, кожен - '<QQd' (slot_seq, frame_id, timestamp) + width * height * channels байт.
+    Останній записаний кадр лежить у слоті (seq - 1) % slots.
+
+    Кожен слот захищено seqlock: перед записом кадру n (n = seq до інкременту) slot_seq = 2n + 1
+    (непарне - запис триває), після запису пікселів і заголовка слоту - 2n + 2.
+    Протокол читання (див. read_latest):
+      1. прочитати seq із заголовка; якщо 0 - кадрів ще немає;
+      2. прочитати slot_seq слоту (seq - 1) % slots; якщо він непарний - слот саме перезаписується;
+      3. скопіювати frame_id, timestamp і пікселі;
+      4. прочитати slot_seq ще раз; якщо він змінився - writer обігнав читача, копію слід відкинути
+         і повторити з кроку 1.
+    """
+
+    HEADER = struct.Struct('<QIIII')
+    SLOT_HEADER = struct.Struct('<QQd')
+    SLOT_SEQ = struct.Struct('<Q')
+
+    def __init__(self, bus, name, width, height, fmt='bgr', slots=4, max_fps=None):
+        if shared_memory is None:
+            raise RuntimeError("multiprocessing.shared_memory is not available")
+
+        self.width = width
+        self.height = height
+        self.channels = 1 if fmt == 'gray' else 3
+        self.slots = slots
+        self.frame_size = width * height * self.channels
+        self.slot_size = self.SLOT_HEADER.size + self.frame_size
+
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=True, size=self.HEADER.size + self.slot_size * slots)
+        self.seq = 0
+        self.HEADER.pack_into(self.shm.buf, 0, 0, width, height, self.channels, slots)
+
+        self.subscription = bus.subscribe(f"shm:{name}", fmt=fmt, width=width, height=height,
+                                          max_fps=max_fps, queue_size=1)
+        self.running = True
+        self.thread = threading.Thread(target=self._worker_loop, name=f"ShmRing:{name}", daemon=True)
+        self.thread.start()
+        print(f"[FrameBus] Shared memory ring '{name}' ({slots} x {self.frame_size} bytes)")
+
+    def close(self):
+        self.running = False
+        self.subscription.close()
+        if self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+
+    def _worker_loop(self):
+        while self.running:
+            frame = self.subscription.get(timeout=0.5)
+            if frame is None:
+                continue
+
+            slot = self.seq % self.slots
+            offset = self.HEADER.size + slot * self.slot_size
+
+            # Непарний slot_seq позначає слот як такий, що перезаписується
+            self.SLOT_SEQ.pack_into(self.shm.buf, offset, 2 * self.seq + 1)
+            start = offset + self.SLOT_HEADER.size
+            self.shm.buf[start:start + self.frame_size] = frame.image.reshape(-1).data
+            self.SLOT_HEADER.pack_into(self.shm.buf, offset, 2 * self.seq + 1, frame.frame_id, frame.timestamp)
+            self.SLOT_SEQ.pack_into(self.shm.buf, offset, 2 * self.seq + 2)
+
+            # seq оновлюється останнім, щоб читач бачив уже записаний слот
+            self.seq += 1
+            self.HEADER.pack_into(self.shm.buf, 0, self.seq, self.width, self.height,
+                                  self.channels, self.slots)
+
+    @classmethod
+    def read_latest(cls, buf, retries=3):
+        """
+        Читає останній кадр з буфера shared memory (наприклад, SharedMemory(name).buf в іншому процесі).
+        Повертає (frame_id, timestamp, width, height, channels, bytes) або None.
+        """
+        for _ in range(retries):
+            seq, width, height, channels, slots = cls.HEADER.unpack_from(buf, 0)
+            if seq == 0:
+                return None
+
+            frame_size = width * height * channels
+            offset = cls.HEADER.size + ((seq - 1) % slots) * (cls.SLOT_HEADER.size + frame_size)
+            before = cls.SLOT_SEQ.unpack_from(buf, offset)[0]
+            if before % 2:
+                continue
+
+            _, frame_id, timestamp = cls.SLOT_HEADER.unpack_from(buf, offset)
+            start = offset + cls.SLOT_HEADER.size
+            pixels = bytes(buf[start:start + frame_size])
+
+            if cls.SLOT_SEQ.unpack_from(buf, offset)[0] == before:
+                return frame_id, timestamp, width, height, channels, pixels
+        return None
@@ -0,0 +1,311 @@
+import selectors
+import socket
+import struct
+import threading
+
+
+class _RelayClient:
+    def __init__(self, sock, mode):
+        self.sock = sock
+        self.mode = mode          # 'request' (чекаємо HTTP-запит), 'http' або 'tcp'
+        self.inbuf = b''
+        self.out = None           # memoryview частини, що зараз відправляється
+        self.offset = 0
+        self.pending = None       # Найновіша частина, що чекає на відправку
+        self.close_after_send = False
+        self.dropped = 0
+
+
+class MjpegRelay:
+    """
+    Ретранслятор сирого JPEG-потоку з телефону без декодування.
+
+    HTTP (multipart/x-mixed-replace): GET /stream - потік, GET /snapshot.jpg - останній кадр.
+    Кут повороту передається в заголовку частини X-Rotation.
+    TCP: той самий формат, що й від телефону - size(>I) | rotation(>i) | jpeg.
+
+    Усі клієнти обслуговуються одним потоком на неблокуючих сокетах (selectors).
+    Кожен клієнт має чергу на один кадр: якщо він не встигає, старий кадр замінюється новим.
+    """
+
+    BOUNDARY = b'phonecamframe'
+    MAX_REQUEST_SIZE = 8192
+
+    def __init__(self, host="127.0.0.1", http_port=None, tcp_port=None):
+        self.host = host
+        self.http_port = http_port
+        self.tcp_port = tcp_port
+
+        self.running = False
+        self.thread = None
+        self.selector = None
+        self.listeners = []
+        self.clients = {}
+
+        self.lock = threading.Lock()
+        self._latest = None       # (seq, jpeg_data, rotation)
+        self._seq = 0
+        self._sent_seq = 0
+        self._parts = {}          # Кеш готових частин поточного кадру за режимом
+        self._wake_r = None
+        self._wake_w = None
+
+    def start(self):
+        if self.running: return
+
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+
+        for port, mode in ((self.http_port, 'request'), (self.tcp_port, 'tcp')):
+            if not port:
+                continue
+            try:
+                srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                srv.bind((self.host, int(port)))
+                srv.listen(64)
+                srv.setblocking(False)
+                self.selector.register(srv, selectors.EVENT_READ, ('listen', mode))
+                self.listeners.append(srv)
+                print(f"[Relay] Listening on {self.host}:{port} ({'http' if mode == 'request' else 'tcp'})")
+            except Exception as e:
+                print(f"[Relay] Failed to listen on port {port}: {e}")
+
+        self.running = True
+        self.thread = threading.Thread(target=self._worker_loop, name="MjpegRelay", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+
+        for client in list(self.clients.values()):
+            self._close_client(client)
+        for srv in self.listeners:
+            try:
+                self.selector.unregister(srv)
+                srv.close()
+            except:
+                pass
+        self.listeners = []
+
+        for sock in (self._wake_r, self._wake_w):
+            if sock:
+                try:
+                    sock.close()
+                except:
+                    pass
+        self._wake_r = self._wake_w = None
+        if self.selector:
+            self.selector.close()
+            self.selector = None
+        print("[Relay] Stopped")
+
+    def publish(self, jpeg_data, rotation):
+        """Викликається з потоку відео для кожного отриманого пакета. Не блокує."""
+        if not self.running:
+            return
+        with self.lock:
+            self._seq += 1
+            self._latest = (self._seq, jpeg_data, rotation)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except Exception:
+            # Буфер пробудження вже заповнений - потік і так прокинеться
+            pass
+
+    def _worker_loop(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=0.5):
+                data = key.data
+                if data == 'wake':
+                    self._drain_wake()
+                elif isinstance(data, tuple):
+                    self._accept(key.fileobj, data[1])
+                else:
+                    if events & selectors.EVENT_READ:
+                        self._on_readable(data)
+                    if events & selectors.EVENT_WRITE and data.sock.fileno() != -1:
+                        self._on_writable(data)
+
+            self._dispatch_latest()
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception:
+            pass
+
+    def _accept(self, srv, mode):
+        try:
+            sock, addr = srv.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _RelayClient(sock, mode)
+        self.clients[sock] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        print(f"[Relay] Client connected: {addr[0]}:{addr[1]} ({mode})")
+
+        # TCP-клієнт одразу отримує останній кадр, щоб не чекати наступного
+        if mode == 'tcp':
+            self._queue_latest(client)
+
+    def _on_readable(self, client):
+        try:
+            chunk = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except Exception:
+            chunk = b''
+
+        if not chunk:
+            self._close_client(client)
+            return
+
+        # Після заголовків запиту вхідні дані ігноруємо
+        if client.mode != 'request':
+            return
+
+        client.inbuf += chunk
+        if b'\r\n\r\n' not in client.inbuf:
+            if len(client.inbuf) > self.MAX_REQUEST_SIZE:
+                self._close_client(client)
+            return
+
+        request_line = client.inbuf.split(b'\r\n', 1)[0].decode('latin-1', 'replace')
+        client.inbuf = b''
+        parts = request_line.split()
+        path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+
+        if len(parts) < 2 or parts[0] != 'GET':
+            self._send_simple(client, b'405 Method Not Allowed')
+        elif path in ('/', '/stream', '/stream.mjpg'):
+            client.mode = 'http'
+            header = (b'HTTP/1.0 200 OK\r\n'
+                      b'Cache-Control: no-cache, no-store, must-revalidate\r\n'
+                      b'Pragma: no-cache\r\n'
+                      b'Connection: close\r\n'
+                      b'Content-Type: multipart/x-mixed-replace; boundary=' + self.BOUNDARY + b'\r\n\r\n')
+            self._start_send(client, header)
+            self._queue_latest(client)
+        elif path == '/snapshot.jpg':
+            latest = self._latest
+            if latest is None:
+                self._send_simple(client, b'503 Service Unavailable')
+            else:
+                _, jpeg_data, rotation = latest
+                header = (b'HTTP/1.0 200 OK\r\n'
+                          b'Content-Type: image/jpeg\r\n'
+                          b'Content-Length: %d\r\n'
+                          b'X-Rotation: %d\r\n'
+                          b'Connection: close\r\n\r\n' % (len(jpeg_data), rotation))
+                client.close_after_send = True
+                self._start_send(client, header + jpeg_data)
+        else:
+            self._send_simple(client, b'404 Not Found')
+
+    def _send_simple(self, client, status):
+        client.mode = 'closing'
+        client.close_after_send = True
+        self._start_send(client, b'HTTP/1.0 ' + status + b'\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+
+    def _start_send(self, client, data):
+        client.out = memoryview(data)
+        client.offset = 0
+        self.selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def _on_writable(self, client):
+        while client.out is not None:
+            try:
+                sent = client.sock.send(client.out[client.offset:])
+            except (BlockingIOError, InterruptedError):
+                return
+            except Exception:
+                self._close_client(client)
+                return
+
+            client.offset += sent
+            if client.offset < len(client.out):
+                return
+
+            # Частину відправлено повністю
+            client.out = None
+            if client.close_after_send:
+                self._close_client(client)
+                return
+            if client.pending is not None:
+                client.out = memoryview(client.pending)
+                client.offset = 0
+                client.pending = None
+
+        self.selector.modify(client.sock, selectors.EVENT_READ, client)
+
+    def _dispatch_latest(self):
+        with self.lock:
+            latest = self._latest
+        if latest is None or latest[0] == self._sent_seq:
+            return
+        self._sent_seq = latest[0]
+        self._parts = {}
+
+        for client in list(self.clients.values()):
+            if client.mode in ('http', 'tcp'):
+                self._queue_latest(client)
+
+    def _queue_latest(self, client):
+        latest = self._latest
+        if latest is None:
+            return
+        part = self._build_part(client.mode, latest)
+
+        if client.out is None:
+            self._start_send(client, part)
+        else:
+            # Клієнт ще відправляє попередній кадр: залишаємо лише найновіший
+            if client.pending is not None:
+                client.dropped += 1
+            client.pending = part
+
+    def _build_part(self, mode, latest):
+        # Частина будується один раз на кадр і спільна для всіх клієнтів цього режиму
+        seq, jpeg_data, rotation = latest
+        cached = self._parts.get(mode)
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+
+        if mode == 'http':
+            part = b''.join((
+                b'--', self.BOUNDARY, b'\r\n',
+                b'Content-Type: image/jpeg\r\n',
+                b'Content-Length: %d\r\n' % len(jpeg_data),
+                b'X-Rotation: %d\r\n\r\n' % rotation,
+                jpeg_data, b'\r\n'))
+        else:
+            part = struct.pack('>Ii', len(jpeg_data), rotation) + jpeg_data
+
+        self._parts[mode] = (seq, part)
+        return part
+
+    def _close_client(self, client):
+        self.clients.pop(client.sock, None)
+        try:
+            self.selector.unregister(client.sock)
+        except Exception:
+            pass
+        try:
+            client.sock.close()
+        except:
+            pass
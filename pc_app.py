@@ -8,6 +8,7 @@ import subprocess
 from adb_utils import AdbManager
 from video_manager import VideoStreamHandler
 from audio_manager import AudioManager
+from tracing import tracer
 
 
 class PhoneCamPCApp:
@@ -35,6 +36,10 @@ class PhoneCamPCApp:
 
         self._setup_ui()
         self._update_protocol_visuals()
+
+        # F8 - увімкнути/вимкнути трасування, F9 - зберегти трасу (Chrome/Perfetto JSON)
+        self.root.bind("<F8>", lambda e: self._toggle_tracing())
+        self.root.bind("<F9>", lambda e: threading.Thread(target=tracer.dump, name="TraceDump", daemon=True).start())
         self.root.after(33, self._update_gui_loop)
 
     def _setup_ui(self):
@@ -135,9 +140,20 @@ class PhoneCamPCApp:
         self.connection_id += 1
         current_attempt_id = self.connection_id
 
-        threading.Thread(target=self._perform_connection, args=(proto, ip, current_attempt_id), daemon=True).start()
+        threading.Thread(target=self._perform_connection, args=(proto, ip, current_attempt_id),
+                         name="Connection", daemon=True).start()
+
+    def _toggle_tracing(self):
+        if tracer.enabled:
+            tracer.disable()
+        else:
+            tracer.enable()
 
     def _perform_connection(self, proto, ip, attempt_id):
+        with tracer.span("connect"):
+            self._connect_handlers(proto, ip, attempt_id)
+
+    def _connect_handlers(self, proto, ip, attempt_id):
         target_host = ip
         target_port_video = 8554
         target_port_audio = 8555
@@ -223,7 +239,8 @@ class PhoneCamPCApp:
         if self.is_connected:
             frame = self.video_handler.get_latest_frame()
             if frame is not None:
-                self._display_frame(frame)
+                with tracer.span("display_frame"):
+                    self._display_frame(frame)
             else:
                 if self.preview_label.cget("text") == "":
                     self.preview_label.config(image="", text="Очікування...", bg="#101010", fg="white")
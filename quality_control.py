@@ -0,0 +1,188 @@
+import time
+
+
+# Сходинки якості: (ширина, висота, якість JPEG, FPS). Індекс 0 - найкраща.
+QUALITY_LADDER = [
+    (1920, 1080, 85, 30),
+    (1920, 1080, 70, 30),
+    (1280, 720, 75, 30),
+    (1280, 720, 60, 24),
+    (960, 540, 60, 20),
+    (640, 360, 50, 15),
+]
+
+
+class QualityController:
+    """
+    Керує якістю потоку на телефоні за виміряними показниками на PC:
+    час обробки кадру, пропускна здатність каналу і глибина черги в сокеті.
+    При перевантаженні знижує якість на одну сходинку, після стабільного
+    періоду - обережно піднімає назад, якщо наступна сходинка вміщується із запасом.
+    Низька частота кадрів самої камери (наприклад, при слабкому освітленні) перевантаженням не вважається.
+    """
+
+    def __init__(self, max_fps=30):
+        self.max_fps = max_fps
+        self.level = 0
+
+        # Пороги
+        self.busy_ratio = 0.85         # Частка бюджету кадру, вище якої вважаємо PC перевантаженим
+        self.link_headroom = 1.1       # Канал має пропускати хоча б needed * headroom байт/с
+        self.upgrade_margin = 1.5      # Запас, з яким наступна сходинка має вміщуватись перед підвищенням
+        self.backlog_limit = 3         # Кадрів поспіль, що вже чекали в сокеті
+        self.upgrade_after = 5.0       # Секунд стабільної роботи перед підвищенням
+        self.max_upgrade_delay = 60.0  # Межа затримки для сходинки, з якої вже доводилось відступати
+        self.downgrade_cooldown = 1.0  # Мінімальний інтервал між зниженнями
+        self.keyframe_interval = 1.0
+
+        self.reset()
+
+    def reset(self):
+        self.level = 0
+        self._process_time = None
+        self._bytes_per_frame = None
+        self._transfer_bytes = None
+        self._transfer_time = None
+        self.backlog = 0
+
+        now = time.monotonic()
+        self._stable_since = now
+        self._last_change = now
+        self._last_keyframe_request = 0.0
+        self._dirty = True
+        self._keyframe_pending = False
+
+        # Гістерезис: скільки чекати перед поверненням на сходинку, з якої довелось відступити
+        self._upgrade_delay = {}
+
+    @property
+    def throughput(self):
+        """Оцінка пропускної здатності каналу, байт/с (за часом читання тіла кадру)."""
+        if not self._transfer_time or self._transfer_bytes is None:
+            return 0.0
+        return self._transfer_bytes / self._transfer_time
+
+    @property
+    def params(self):
+        """Поточні параметри (width, height, jpeg_quality, fps)."""
+        return self._level_params(self.level)
+
+    def on_frame(self, size_bytes, process_time, backlogged, transfer_time=0.0):
+        """
+        Реєструє кадр.
+        process_time - час декодування та обробки (None для пропущеного кадру),
+        backlogged - чи наступний кадр уже чекав у сокеті,
+        transfer_time - скільки читалось тіло кадру з сокета.
+        """
+        now = time.monotonic()
+
+        if process_time is not None:
+            self._process_time = self._ewma(self._process_time, process_time)
+        self._bytes_per_frame = self._ewma(self._bytes_per_frame, size_bytes)
+
+        # Байти й час усереднюються окремо, щоб миттєві читання з буфера не роздували оцінку
+        self._transfer_bytes = self._ewma(self._transfer_bytes, size_bytes)
+        self._transfer_time = self._ewma(self._transfer_time, max(transfer_time, 1e-4))
+
+        self.backlog = self.backlog + 1 if backlogged else 0
+
+        self._evaluate(now)
+
+    def request_keyframe(self):
+        now = time.monotonic()
+        if now - self._last_keyframe_request >= self.keyframe_interval:
+            self._last_keyframe_request = now
+            self._keyframe_pending = True
+
+    def should_drop(self):
+        """Кадр можна не декодувати: за ним у сокеті вже є новіший."""
+        return self.backlog >= self.backlog_limit
+
+    def poll_update(self):
+        """
+        Повертає (width, height, jpeg_quality, fps, keyframe), якщо телефону треба надіслати
+        нові параметри, інакше None. Якщо надіслати не вдалося, слід викликати restore_update.
+        """
+        if not self._dirty and not self._keyframe_pending:
+            return None
+        keyframe = self._keyframe_pending
+        self._dirty = False
+        self._keyframe_pending = False
+        return self.params + (keyframe,)
+
+    def restore_update(self, update):
+        """Повертає оновлення в чергу після невдалої відправки."""
+        self._dirty = True
+        if update[4]:
+            self._keyframe_pending = True
+
+    def _evaluate(self, now):
+        if self._process_time is None or self._bytes_per_frame is None:
+            return
+
+        fps = self.params[3]
+        budget = 1.0 / fps
+        needed = self._bytes_per_frame * fps
+        pc_busy = self._process_time > budget * self.busy_ratio
+        link_slow = self.throughput < needed * self.link_headroom
+        queued = self.backlog >= self.backlog_limit
+
+        if pc_busy or link_slow or queued:
+            self._stable_since = now
+            if queued:
+                self.request_keyframe()
+            if now - self._last_change >= self.downgrade_cooldown:
+                # Наступна спроба повернутись на цю сходинку буде відкладена вдвічі довше
+                delay = self._upgrade_delay.get(self.level, self.upgrade_after)
+                self._upgrade_delay[self.level] = min(delay * 2, self.max_upgrade_delay)
+                self._set_level(self.level + 1, now)
+            return
+
+        if self.level == 0:
+            return
+        delay = self._upgrade_delay.get(self.level - 1, self.upgrade_after)
+        if now - self._stable_since >= delay and self._next_level_fits():
+            self._stable_since = now
+            self._set_level(self.level - 1, now)
+
+    def _next_level_fits(self):
+        """Чи вміститься вища сходинка з запасом upgrade_margin за часом обробки та каналом."""
+        current = self._frame_cost(self.level)
+        upper = self._frame_cost(self.level - 1)
+        ratio = upper / current
+        next_fps = self._level_params(self.level - 1)[3]
+
+        fits_pc = self._process_time * ratio * self.upgrade_margin <= self.busy_ratio / next_fps
+        needed = self._bytes_per_frame * ratio * next_fps
+        fits_link = self.throughput >= needed * self.link_headroom * self.upgrade_margin
+        return fits_pc and fits_link
+
+    def _level_params(self, level):
+        width, height, quality, fps = QUALITY_LADDER[level]
+        return width, height, quality, min(fps, self.max_fps)
+
+    @staticmethod
+    def _frame_cost(level):
+        # Груба оцінка розміру JPEG: пропорційно кількості пікселів і якості
+        width, height, quality, _ = QUALITY_LADDER[level]
+        return width * height * quality
+
+    def _set_level(self, level, now):
+        level = min(max(level, 0), len(QUALITY_LADDER) - 1)
+        if level == self.level:
+            return
+        print(f"[Quality] Level {self.level} -> {level}: {QUALITY_LADDER[level]}")
+        self.level = level
+        self._last_change = now
+        self._dirty = True
+        # Після зміни параметрів старі виміри вже не відповідають новому режиму
+        self._process_time = None
+        self._bytes_per_frame = None
+        self._transfer_bytes = None
+        self._transfer_time = None
+
+    @staticmethod
+    def _ewma(previous, value, alpha=0.2):
+        if previous is None:
+            return value
+        return previous + alpha * (value - previous)
@@ -1,7 +1,15 @@
+import select
 import socket
 import struct
 import time
 
+# Зворотне керуюче повідомлення PC -> телефон:
+# magic(4) | version(1) | width(2) | height(2) | jpeg_quality(1) | fps(1) | flags(1)
+CONTROL_MAGIC = b'PCQC'
+CONTROL_VERSION = 1
+CONTROL_FORMAT = '>4sBHHBBB'
+CONTROL_FLAG_KEYFRAME = 0x01
+
 
 class StreamClient:
     """
@@ -14,6 +22,9 @@ class StreamClient:
         self.socket = None
         self.is_connected = False
 
+        # Час читання тіла останнього кадру - для оцінки пропускної здатності каналу
+        self.last_body_time = 0.0
+
     def connect(self, timeout=2.0):
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -71,9 +82,11 @@ class StreamClient:
             rotation = raw_rotation % 360
 
             # Читаємо тіло
+            body_started = time.perf_counter()
             image_data = self._recv_all(size)
             if not image_data:
                 raise ConnectionResetError("Connection lost (incomplete body)")
+            self.last_body_time = time.perf_counter() - body_started
 
             return image_data, rotation
 
@@ -83,6 +96,34 @@ class StreamClient:
             self.close()
             raise e
 
+    def send_control(self, width, height, jpeg_quality, fps, keyframe=False):
+        """
+        Надсилає телефону бажані параметри потоку тим самим сокетом.
+        Повертає False, якщо надіслати не вдалося (з'єднання при цьому не закривається).
+        """
+        if not self.socket:
+            return False
+
+        flags = CONTROL_FLAG_KEYFRAME if keyframe else 0
+        message = struct.pack(CONTROL_FORMAT, CONTROL_MAGIC, CONTROL_VERSION,
+                              int(width), int(height), int(jpeg_quality), int(fps), flags)
+        try:
+            self.socket.sendall(message)
+            return True
+        except Exception as e:
+            print(f"[Protocol] Control send failed: {e}")
+            return False
+
+    def has_pending_data(self):
+        """Чи є в сокеті вже отримані дані (тобто наступний кадр чекає в черзі)."""
+        if not self.socket:
+            return False
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+            return bool(readable)
+        except Exception:
+            return False
+
     def _recv_all(self, n):
         """Читає рівно n байт з сокета."""
         data = b''
@@ -97,3 +138,170 @@ class StreamClient:
             except Exception:
                 return None
         return data
+
+
+# Узгодження аудіо-кодека PC -> телефон: magic(4) | version(1) | preferred_codec(1)
+# Відповідь телефону: magic(4) | version(1) | codec(1) | channels(1) | sample_rate(4)
+AUDIO_MAGIC = b'PCAU'
+AUDIO_VERSION = 1
+AUDIO_HELLO_FORMAT = '>4sBB'
+AUDIO_REPLY_FORMAT = '>4sBBBI'
+AUDIO_CODEC_PCM = 0
+AUDIO_CODEC_OPUS = 1
+# Частоти, які підтримує libopus, і розумні межі для PCM
+AUDIO_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+AUDIO_MAX_CHANNELS = 8
+AUDIO_RATE_RANGE = (8000, 192000)
+# Пакет Opus: seq(>H) | length(>H) | payload
+OPUS_PACKET_HEADER = '>HH'
+
+
+class AudioStreamClient:
+    """
+    TCP з'єднання для аудіо.
+    Старі версії телефону одразу шлють сирий PCM16 і не відповідають на узгодження,
+    тому PCM залишається запасним варіантом.
+    """
+
+    def __init__(self, host, port, sample_rate=44100, channels=1):
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.is_connected = False
+
+        # Результат узгодження
+        self.codec = AUDIO_CODEC_PCM
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+        self._default_rate = sample_rate
+        self._default_channels = channels
+        self._buffer = bytearray()
+
+    def connect(self, timeout=2.0):
+        try:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect((self.host, self.port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.is_connected = True
+            self._buffer.clear()
+            return True
+        except Exception:
+            self.close()
+            return False
+
+    def close(self):
+        if self.socket:
+            try:
+                self.socket.close()
+            except:
+                pass
+        self.socket = None
+        self.is_connected = False
+        self._buffer.clear()
+
+    def negotiate(self, preferred_codec, timeout=1.0):
+        """
+        Пропонує телефону кодек і чекає відповіді.
+        Якщо телефон відповідає не заголовком, а даними - це стара версія, і отримані байти
+        залишаються в буфері як PCM.
+        """
+        self.codec = AUDIO_CODEC_PCM
+        self.sample_rate = self._default_rate
+        self.channels = self._default_channels
+
+        try:
+            self.socket.sendall(struct.pack(AUDIO_HELLO_FORMAT, AUDIO_MAGIC, AUDIO_VERSION, preferred_codec))
+        except Exception as e:
+            print(f"[Protocol] Audio hello failed: {e}")
+            return self.codec
+
+        reply_size = struct.calcsize(AUDIO_REPLY_FORMAT)
+        deadline = time.monotonic() + timeout
+        try:
+            while len(self._buffer) < reply_size:
+                # Заголовок не збігається - далі не чекаємо, це вже PCM
+                if not AUDIO_MAGIC.startswith(bytes(self._buffer[:len(AUDIO_MAGIC)])):
+                    return self.codec
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self.codec
+                self.socket.settimeout(remaining)
+                if not self._fill():
+                    raise ConnectionResetError("Connection lost (negotiation)")
+        except socket.timeout:
+            return self.codec
+
+        magic, _version, codec, channels, sample_rate = struct.unpack_from(AUDIO_REPLY_FORMAT, self._buffer)
+        if magic != AUDIO_MAGIC:
+            return self.codec
+
+        del self._buffer[:reply_size]
+        error = self._check_reply(codec, channels, sample_rate)
+        if error:
+            # Некоректна відповідь не повинна зациклювати перепідключення: лишаємось на PCM за замовчуванням
+            print(f"[Protocol] Invalid audio reply ({error}), falling back to PCM")
+            return self.codec
+
+        self.codec = codec
+        self.channels = channels
+        self.sample_rate = sample_rate
+        return self.codec
+
+    @staticmethod
+    def _check_reply(codec, channels, sample_rate):
+        """Повертає опис проблеми у відповіді телефону або None, якщо вона коректна."""
+        if codec not in (AUDIO_CODEC_PCM, AUDIO_CODEC_OPUS):
+            return f"unknown codec {codec}"
+        if not 1 <= channels <= AUDIO_MAX_CHANNELS:
+            return f"{channels} channels"
+        if codec == AUDIO_CODEC_OPUS:
+            if sample_rate not in AUDIO_OPUS_RATES:
+                return f"Opus at {sample_rate} Hz"
+        elif not AUDIO_RATE_RANGE[0] <= sample_rate <= AUDIO_RATE_RANGE[1]:
+            return f"PCM at {sample_rate} Hz"
+        return None
+
+    def read_pcm(self, max_bytes, timeout=3.0):
+        """Повертає до max_bytes сирих байт PCM."""
+        if not self._buffer:
+            self.socket.settimeout(timeout)
+            if not self._fill():
+                raise ConnectionResetError("No data")
+        data = bytes(self._buffer[:max_bytes])
+        del self._buffer[:max_bytes]
+        return data
+
+    def read_opus_packet(self, timeout):
+        """
+        Повертає (seq, payload) або None, якщо пакет не встиг прийти за timeout.
+        Частково отримані дані зберігаються до наступного виклику.
+        """
+        header_size = struct.calcsize(OPUS_PACKET_HEADER)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                if len(self._buffer) >= header_size:
+                    seq, length = struct.unpack_from(OPUS_PACKET_HEADER, self._buffer)
+                    total = header_size + length
+                    if len(self._buffer) >= total:
+                        payload = bytes(self._buffer[header_size:total])
+                        del self._buffer[:total]
+                        return seq, payload
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.socket.settimeout(remaining)
+                if not self._fill():
+                    raise ConnectionResetError("Connection lost (opus packet)")
+        except socket.timeout:
+            return None
+
+    def _fill(self):
+        packet = self.socket.recv(65536)
+        if not packet:
+            return False
+        self._buffer += packet
+        return True
@@ -0,0 +1,220 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+
+class _NullSpan:
+    """Порожній span, який повертається, коли трасування вимкнене."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'frame_id', 'start')
+
+    def __init__(self, tracer, name, frame_id):
+        self.tracer = tracer
+        self.name = name
+        self.frame_id = frame_id
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        self.tracer._record(('X', self.name, 'stage', self.start, end - self.start,
+                             threading.get_ident(), self.frame_id, None))
+        return False
+
+
+class Tracer:
+    """
+    Легке трасування етапів обробки з експортом у формат Chrome trace (Perfetto, chrome://tracing).
+
+    Події пишуться в кільцевий буфер фіксованого розміру без блокувань:
+    номер слоту береться з itertools.count, next() якого атомарний під GIL.
+    Коли трасування вимкнене, span() повертає спільний порожній об'єкт.
+    """
+
+    def __init__(self, capacity=65536):
+        self.enabled = False
+        self.capacity = capacity
+        self._events = [None] * capacity
+        self._counter = itertools.count()
+
+        # Кадр довший за бюджет вважається аномалією
+        self.frame_budget_ms = 50.0
+        self.dump_on_anomaly = False
+        self.dump_dir = "."
+        self.dump_cooldown = 10.0
+        self._last_dump = 0.0
+
+        self._sampler_thread = None
+        self._sampler_running = False
+        # Чи просили семплювання: enable() перезапускає його після disable()
+        self.sampler_requested = False
+        # Кожен зріз стеків бере GIL, тож часте семплювання саме створює конкуренцію за нього
+        self.sample_interval = 0.015
+
+    def enable(self):
+        self.enabled = True
+        if self.sampler_requested:
+            self._start_sampler_thread()
+        print("[Trace] Enabled")
+
+    def disable(self):
+        self.enabled = False
+        self._stop_sampler_thread()
+        print("[Trace] Disabled")
+
+    def clear(self):
+        self._events = [None] * self.capacity
+        self._counter = itertools.count()
+
+    def span(self, name, frame_id=None):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, frame_id)
+
+    def instant(self, name, frame_id=None, args=None):
+        if not self.enabled:
+            return
+        self._record(('i', name, 'event', time.perf_counter_ns(), 0,
+                      threading.get_ident(), frame_id, args))
+
+    def frame_done(self, frame_id, start_ns):
+        """Фіксує повний час кадру; при перевищенні бюджету позначає аномалію і за потреби зберігає дамп."""
+        if not self.enabled:
+            return
+        end = time.perf_counter_ns()
+        duration = end - start_ns
+        self._record(('X', 'frame', 'frame', start_ns, duration, threading.get_ident(), frame_id, None))
+
+        duration_ms = duration / 1e6
+        if duration_ms <= self.frame_budget_ms:
+            return
+
+        self.instant('frame_over_budget', frame_id, {'duration_ms': round(duration_ms, 2)})
+        now = time.monotonic()
+        if self.dump_on_anomaly and now - self._last_dump >= self.dump_cooldown:
+            self._last_dump = now
+            # Запис файлу не повинен гальмувати потік, що знайшов аномалію
+            threading.Thread(target=self.dump, args=(None, f"frame {frame_id}"), daemon=True).start()
+
+    def dump(self, path=None, reason="manual"):
+        """Зберігає вміст буфера як Chrome trace JSON. Повертає шлях до файлу або None."""
+        events = [e for e in list(self._events) if e is not None]
+        events.sort(key=lambda e: e[3])
+
+        if path is None:
+            stamp = time.strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(self.dump_dir, f"phonecam_trace_{stamp}.json")
+
+        pid = os.getpid()
+        trace_events = []
+        for thread in threading.enumerate():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread.ident,
+                                 'args': {'name': thread.name}})
+
+        for ph, name, cat, ts, dur, tid, frame_id, args in events:
+            if cat == 'sample':
+                # Стеки зберігаються сирими кортежами, рядки формуються лише тут
+                stack = [self._format_frame(entry) for entry in args]
+                name, args = stack[0], {'stack': stack}
+            event = {'name': name, 'cat': cat, 'ph': ph, 'ts': ts / 1000.0, 'pid': pid, 'tid': tid}
+            if ph == 'X':
+                event['dur'] = dur / 1000.0
+            else:
+                event['s'] = 't'
+            event_args = dict(args) if args else {}
+            if frame_id is not None:
+                event_args['frame'] = frame_id
+            if event_args:
+                event['args'] = event_args
+            trace_events.append(event)
+
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms',
+                           'otherData': {'reason': reason}}, f)
+            print(f"[Trace] Dumped {len(events)} events to {path} ({reason})")
+            return path
+        except Exception as e:
+            print(f"[Trace] Dump failed: {e}")
+            return None
+
+    # --- Семплюючий профайлер ---
+
+    def start_sampler(self, interval=None):
+        """
+        Періодично знімає стеки всіх потоків (sys._current_frames) і пише їх у той самий буфер
+        миттєвими подіями: у трасі під кожним потоком видно, яка функція виконувалась.
+        """
+        if interval:
+            self.sample_interval = interval
+        self.sampler_requested = True
+        self._start_sampler_thread()
+
+    def stop_sampler(self):
+        self.sampler_requested = False
+        self._stop_sampler_thread()
+
+    def _start_sampler_thread(self):
+        if self._sampler_running:
+            return
+        self._sampler_running = True
+        self._sampler_thread = threading.Thread(target=self._sampler_loop, name="TraceSampler", daemon=True)
+        self._sampler_thread.start()
+
+    def _stop_sampler_thread(self):
+        self._sampler_running = False
+        if self._sampler_thread and self._sampler_thread.is_alive():
+            self._sampler_thread.join(timeout=1.0)
+        self._sampler_thread = None
+
+    def _sampler_loop(self):
+        own = threading.get_ident()
+        while self._sampler_running:
+            if self.enabled:
+                now = time.perf_counter_ns()
+                for tid, frame in sys._current_frames().items():
+                    if tid == own:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < 16:
+                        code = frame.f_code
+                        stack.append((code.co_filename, code.co_name, frame.f_lineno))
+                        frame = frame.f_back
+                    if stack:
+                        self._record(('i', None, 'sample', now, 0, tid, None, stack))
+            time.sleep(self.sample_interval)
+
+    @staticmethod
+    def _format_frame(entry):
+        filename, name, lineno = entry
+        return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+    def _record(self, event):
+        self._events[next(self._counter) % self.capacity] = event
+
+
+# Спільний трасувальник для всіх модулів.
+# PHONECAM_TRACE=1 вмикає його під час старту, PHONECAM_TRACE_SAMPLER=1 - ще й семплювання стеків.
+tracer = Tracer()
+if os.environ.get("PHONECAM_TRACE") == "1":
+    tracer.enable()
+    tracer.dump_on_anomaly = True
+    if os.environ.get("PHONECAM_TRACE_SAMPLER") == "1":
+        tracer.start_sampler()
@@ -0,0 +1,218 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+# Прапорці зменшеного декодування JPEG (декодер сам пропускає коефіцієнти DCT)
+_REDUCED_DECODE = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class FilterChain:
+    """
+    Ланцюжок фільтрів кадру.
+    Геометрія (поворот, кроп, зум, дзеркало, letterbox) зводиться в одну афінну матрицю
+    і виконується одним cv2.warpAffine. Тональні зміни (яскравість, контраст, гамма)
+    застосовуються через 256-елементну LUT.
+    Параметри можна змінювати з іншого потоку, буфери при цьому не перевиділяються.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.lock = threading.Lock()
+
+        # Геометричні параметри
+        self.crop = (0.0, 0.0, 1.0, 1.0)  # x, y, w, h у частках повернутого кадру
+        self.zoom = 1.0
+        self.pan = (0.0, 0.0)              # зсув зуму в межах кропу, -1..1
+        self.mirror = False
+
+        # Тональні параметри
+        self.brightness = 0.0  # -1..1
+        self.contrast = 1.0
+        self.gamma = 1.0
+
+        self._geometry_dirty = True
+        self._tone_dirty = True
+
+        # Ключ, за яким кешується матриця: (src_w, src_h, rotation)
+        self._geometry_key = None
+        self._matrix = np.zeros((2, 3), dtype=np.float64)
+        self._content_rect = (0, 0, width, height)
+        self._lut = np.arange(256, dtype=np.uint8)
+        self._lut_identity = True
+
+        # Повний (незменшений) розмір останнього кадру до повороту, для вибору режиму декодування
+        self._full_size = None
+        self._decode_factor = 1
+
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+
+    # --- Налаштування (викликаються з GUI) ---
+
+    def set_crop(self, x, y, w, h):
+        x = min(max(float(x), 0.0), 1.0)
+        y = min(max(float(y), 0.0), 1.0)
+        w = min(max(float(w), 0.01), 1.0 - x)
+        h = min(max(float(h), 0.01), 1.0 - y)
+        with self.lock:
+            self.crop = (x, y, w, h)
+            self._geometry_dirty = True
+
+    def set_zoom(self, zoom, pan_x=0.0, pan_y=0.0):
+        with self.lock:
+            self.zoom = max(float(zoom), 1.0)
+            self.pan = (min(max(float(pan_x), -1.0), 1.0), min(max(float(pan_y), -1.0), 1.0))
+            self._geometry_dirty = True
+
+    def set_mirror(self, enabled):
+        with self.lock:
+            self.mirror = bool(enabled)
+            self._geometry_dirty = True
+
+    def set_tone(self, brightness=None, contrast=None, gamma=None):
+        with self.lock:
+            if brightness is not None:
+                self.brightness = min(max(float(brightness), -1.0), 1.0)
+            if contrast is not None:
+                self.contrast = max(float(contrast), 0.0)
+            if gamma is not None:
+                self.gamma = max(float(gamma), 0.01)
+            self._tone_dirty = True
+
+    def reset(self):
+        with self.lock:
+            self.crop = (0.0, 0.0, 1.0, 1.0)
+            self.zoom = 1.0
+            self.pan = (0.0, 0.0)
+            self.mirror = False
+            self.brightness = 0.0
+            self.contrast = 1.0
+            self.gamma = 1.0
+            self._geometry_dirty = True
+            self._tone_dirty = True
+
+    # --- Обробка (викликаються з потоку відео) ---
+
+    def decode_flags(self, rotation):
+        """
+        Підбирає режим cv2.imdecode: якщо видима область навіть після зменшення у 2/4/8 разів
+        не менша за вихідний розмір, декодуємо JPEG одразу зменшеним.
+        """
+        if self._full_size is None:
+            return cv2.IMREAD_COLOR
+
+        w, h = self._full_size
+        if rotation in (90, 270):
+            w, h = h, w
+
+        with self.lock:
+            region_w, region_h = self._region_size(w, h)
+
+        scale = min(self.width / region_w, self.height / region_h)
+        for factor, flag in _REDUCED_DECODE:
+            if scale * factor <= 1.0:
+                self._decode_factor = factor
+                return flag
+        self._decode_factor = 1
+        return cv2.IMREAD_COLOR
+
+    def apply(self, frame, rotation):
+        """Повертає canvas розміром width x height з обробленим кадром."""
+        src_h, src_w = frame.shape[:2]
+        self._full_size = (src_w * self._decode_factor, src_h * self._decode_factor)
+
+        key = (src_w, src_h, rotation)
+        with self.lock:
+            if self._geometry_dirty or key != self._geometry_key:
+                self._update_geometry(src_w, src_h, rotation)
+                self._geometry_key = key
+                self._geometry_dirty = False
+            if self._tone_dirty:
+                self._update_lut()
+                self._tone_dirty = False
+            matrix = self._matrix
+            x0, y0, cw, ch = self._content_rect
+
+        # Малюємо лише в область контенту, смуги letterbox обнулені заздалегідь
+        target = self.canvas[y0:y0 + ch, x0:x0 + cw]
+        cv2.warpAffine(frame, matrix, (cw, ch), dst=target,
+                       flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+        if not self._lut_identity:
+            cv2.LUT(target, self._lut, dst=target)
+
+        return self.canvas
+
+    @property
+    def content_rect(self):
+        """(x, y, w, h) області canvas без чорних смуг."""
+        return self._content_rect
+
+    def _region_size(self, rot_w, rot_h):
+        _, _, cw, ch = self.crop
+        return rot_w * cw / self.zoom, rot_h * ch / self.zoom
+
+    def _update_geometry(self, src_w, src_h, rotation):
+        # Усі перетворення в неперервних координатах (центр пікселя = i + 0.5)
+        if rotation == 90:
+            rot = np.array([[0, -1, src_h], [1, 0, 0], [0, 0, 1]], dtype=np.float64)
+            rot_w, rot_h = src_h, src_w
+        elif rotation == 180:
+            rot = np.array([[-1, 0, src_w], [0, -1, src_h], [0, 0, 1]], dtype=np.float64)
+            rot_w, rot_h = src_w, src_h
+        elif rotation == 270:
+            rot = np.array([[0, 1, 0], [-1, 0, src_w], [0, 0, 1]], dtype=np.float64)
+            rot_w, rot_h = src_h, src_w
+        else:
+            rot = np.eye(3, dtype=np.float64)
+            rot_w, rot_h = src_w, src_h
+
+        # Видима область: кроп, звужений зумом навколо свого центру зі зсувом pan
+        cx, cy, cw, ch = self.crop
+        region_w, region_h = self._region_size(rot_w, rot_h)
+        crop_x, crop_y = cx * rot_w, cy * rot_h
+        free_x = cw * rot_w - region_w
+        free_y = ch * rot_h - region_h
+        region_x = crop_x + free_x * (self.pan[0] + 1.0) / 2.0
+        region_y = crop_y + free_y * (self.pan[1] + 1.0) / 2.0
+
+        # Letterbox: вписуємо область у вихідний розмір зі збереженням пропорцій
+        scale = min(self.width / region_w, self.height / region_h)
+        cw_px = max(1, min(self.width, int(round(region_w * scale))))
+        ch_px = max(1, min(self.height, int(round(region_h * scale))))
+        x0 = (self.width - cw_px) // 2
+        y0 = (self.height - ch_px) // 2
+
+        if self.mirror:
+            fit = np.array([[-scale, 0, (region_x + region_w) * scale],
+                            [0, scale, -region_y * scale],
+                            [0, 0, 1]], dtype=np.float64)
+        else:
+            fit = np.array([[scale, 0, -region_x * scale],
+                            [0, scale, -region_y * scale],
+                            [0, 0, 1]], dtype=np.float64)
+
+        # Перехід до піксельних координат OpenCV
+        to_cont = np.array([[1, 0, 0.5], [0, 1, 0.5], [0, 0, 1]], dtype=np.float64)
+        to_pixel = np.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]], dtype=np.float64)
+        full = to_pixel @ fit @ rot @ to_cont
+        self._matrix[:] = full[:2]
+
+        if (x0, y0, cw_px, ch_px) != self._content_rect:
+            self.canvas[:] = 0
+            self._content_rect = (x0, y0, cw_px, ch_px)
+
+    def _update_lut(self):
+        self._lut_identity = self.brightness == 0.0 and self.contrast == 1.0 and self.gamma == 1.0
+        if self._lut_identity:
+            return
+        v = np.arange(256, dtype=np.float64) / 255.0
+        v = np.power(v, 1.0 / self.gamma)
+        v = (v - 0.5) * self.contrast + 0.5 + self.brightness
+        self._lut[:] = np.clip(np.rint(v * 255.0), 0, 255).astype(np.uint8)
@@ -1,8 +1,14 @@
 import cv2
+import os
 import threading
 import time
 import numpy as np
 from stream_protocol import StreamClient
+from video_filters import FilterChain
+from quality_control import QualityController
+from frame_bus import FrameBus
+from mjpeg_relay import MjpegRelay
+from tracing import tracer
 
 # Спробуємо імпортувати pyvirtualcam безпечно
 try:
@@ -12,11 +18,27 @@ except ImportError:
     print("Error: pyvirtualcam not installed. Run 'pip install pyvirtualcam'")
 
 
+def _env_port(name):
+    """Порт з змінної середовища або None, якщо її не задано чи значення некоректне."""
+    value = os.environ.get(name)
+    if not value:
+        return None
+    try:
+        port = int(value)
+    except ValueError:
+        port = 0
+    if not 0 < port < 65536:
+        print(f"[VideoMgr] Ignoring {name}={value!r}: not a valid port")
+        return None
+    return port
+
+
 class VideoStreamHandler:
     def __init__(self):
         self.running = False
         self.thread = None
         self.virtual_cam = None
+        self.virtual_cam_thread = None
         self.current_frame = None
         self.lock = threading.Lock()
 
@@ -24,6 +46,28 @@ class VideoStreamHandler:
         self.target_height = 1080
         self.fps = 30
 
+        # Ланцюжок фільтрів; параметри можна змінювати під час трансляції
+        self.filters = FilterChain(self.target_width, self.target_height)
+
+        # Зворотний канал керування якістю на телефоні
+        self.quality_control_enabled = True
+        self.quality = QualityController(max_fps=self.fps)
+        self.dropped_frames = 0
+
+        # Шина кадрів: декодуємо один раз, розсилаємо всім споживачам
+        self.bus = FrameBus()
+        self.frame_id = 0
+        self._preview_sub = None
+        self._virtual_cam_sub = None
+
+        # Локальний ретранслятор сирого JPEG (None - вимкнено).
+        # Вмикається змінними PHONECAM_RELAY_HTTP_PORT / PHONECAM_RELAY_TCP_PORT,
+        # PHONECAM_RELAY_HOST=0.0.0.0 відкриває його для інших машин у мережі.
+        self.relay_host = os.environ.get("PHONECAM_RELAY_HOST") or "127.0.0.1"
+        self.relay_http_port = _env_port("PHONECAM_RELAY_HTTP_PORT")
+        self.relay_tcp_port = _env_port("PHONECAM_RELAY_TCP_PORT")
+        self.relay = None
+
         # Налаштування підключення
         self.target_host = "127.0.0.1"
         self.target_port = 8554
@@ -36,26 +80,59 @@ class VideoStreamHandler:
         self.target_port = int(port)
         self.running = True
 
+        # Прев'ю для GUI: без чорних смуг, у RGB
+        self._preview_sub = self.bus.subscribe("preview", fmt="rgb", content_only=True, max_fps=self.fps)
+        if pyvirtualcam is not None:
+            self._virtual_cam_sub = self.bus.subscribe("virtual_cam", fmt="bgr")
+            self.virtual_cam_thread = threading.Thread(target=self._virtual_cam_loop, name="VirtualCam", daemon=True)
+            self.virtual_cam_thread.start()
+
+        if self.relay_http_port or self.relay_tcp_port:
+            self.relay = MjpegRelay(self.relay_host, self.relay_http_port, self.relay_tcp_port)
+            self.relay.start()
+
         print(f"[VideoMgr] Starting thread for {self.target_host}:{self.target_port}")
-        self.thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.thread = threading.Thread(target=self._worker_loop, name="VideoWorker", daemon=True)
         self.thread.start()
 
     def stop(self):
         self.running = False
+        for sub in (self._preview_sub, self._virtual_cam_sub):
+            if sub:
+                sub.close()
+        self._preview_sub = None
+        self._virtual_cam_sub = None
+
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=1.0)
+        if self.virtual_cam_thread and self.virtual_cam_thread.is_alive():
+            self.virtual_cam_thread.join(timeout=1.0)
 
         self._close_virtual_cam()
 
+        if self.relay:
+            self.relay.stop()
+            self.relay = None
+
         with self.lock:
             self.current_frame = None
         print("[VideoMgr] Stopped")
 
     def get_latest_frame(self):
+        # Кадри з шини доступні лише для читання, тому копія не потрібна
+        sub = self._preview_sub
+        frame = sub.get_latest() if sub else None
         with self.lock:
-            if self.current_frame is not None:
-                return self.current_frame.copy()
-        return None
+            if frame is not None:
+                self.current_frame = frame.image
+            return self.current_frame
+
+    def _clear_preview(self):
+        sub = self._preview_sub
+        if sub:
+            sub.get_latest()
+        with self.lock:
+            self.current_frame = None
 
     def _setup_virtual_cam(self):
         if pyvirtualcam is None: return
@@ -77,8 +154,23 @@ class VideoStreamHandler:
             self.virtual_cam.close()
             self.virtual_cam = None
 
-    def _worker_loop(self):
+    def _virtual_cam_loop(self):
+        # Віртуальна камера - окремий підписник, її темп не гальмує декодування
         self._setup_virtual_cam()
+        sub = self._virtual_cam_sub
+
+        while self.running and sub and not sub.closed:
+            frame = sub.get(timeout=0.5)
+            if frame is None or self.virtual_cam is None:
+                continue
+            with tracer.span("vcam_send", frame.frame_id):
+                self.virtual_cam.send(frame.image)
+            with tracer.span("vcam_sleep", frame.frame_id):
+                self.virtual_cam.sleep_until_next_frame()
+
+        self._close_virtual_cam()
+
+    def _worker_loop(self):
         client = StreamClient(self.target_host, self.target_port)
 
         while self.running:
@@ -87,47 +179,55 @@ class VideoStreamHandler:
                 if not connected:
                     time.sleep(1.0)
                     continue
+                self.quality.reset()
 
             try:
-                jpeg_data, rotation = client.receive_packet()
+                self._send_quality_update(client)
+
+                with tracer.span("recv_packet"):
+                    jpeg_data, rotation = client.receive_packet()
+                started_ns = time.perf_counter_ns()
+                self.frame_id += 1
+                frame_id = self.frame_id
+
+                # Сирий JPEG іде в ретранслятор без декодування, навіть якщо кадр далі буде пропущено
+                if self.relay:
+                    self.relay.publish(jpeg_data, rotation)
+
+                # Якщо обробка не встигає, кадри накопичуються в сокеті.
+                # Пропускаємо декодування застарілих кадрів, щоб наздогнати потік.
+                backlogged = self.quality_control_enabled and client.has_pending_data()
+                if backlogged and self.quality.should_drop():
+                    self.dropped_frames += 1
+                    tracer.instant("frame_dropped", frame_id)
+                    self.quality.on_frame(len(jpeg_data), None, backlogged, client.last_body_time)
+                    continue
+
                 nparr = np.frombuffer(jpeg_data, np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                # Якщо видима область набагато більша за вихід, декодуємо JPEG одразу зменшеним
+                with tracer.span("imdecode", frame_id):
+                    frame = cv2.imdecode(nparr, self.filters.decode_flags(rotation))
 
                 if frame is not None:
-                    # 1. Поворот зображення
-                    frame = self._rotate_image(frame, rotation)
-
-                    # 2. Відправка у віртуальну камеру (з збереженням пропорцій)
-                    # Створюємо чорний фон (canvas) розміром з віртуальну камеру
-                    canvas = np.zeros((self.target_height, self.target_width, 3), dtype=np.uint8)
-
-                    # Вписуємо зображення в canvas
-                    resized_frame = self._resize_contain(frame, self.target_width, self.target_height)
-
-                    # Центруємо зображення на фоні
-                    h_small, w_small = resized_frame.shape[:2]
-                    y_offset = (self.target_height - h_small) // 2
-                    x_offset = (self.target_width - w_small) // 2
+                    # Поворот, кроп/зум, дзеркало, letterbox і тональна корекція за один прохід
+                    with tracer.span("filters", frame_id):
+                        canvas = self.filters.apply(frame, rotation)
 
-                    canvas[y_offset:y_offset + h_small, x_offset:x_offset + w_small] = resized_frame
+                    if self.quality_control_enabled:
+                        self.quality.on_frame(len(jpeg_data), (time.perf_counter_ns() - started_ns) / 1e9,
+                                             backlogged, client.last_body_time)
 
-                    # Відправка у віртуальну камеру
-                    if self.virtual_cam:
-                        self.virtual_cam.send(canvas)
-                        self.virtual_cam.sleep_until_next_frame()
-
-                    # Оновлення прев'ю для GUI (використовуємо той самий кадр, але в RGB)
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # Для прев'ю краще оригінал без смуг
-                    with self.lock:
-                        self.current_frame = rgb_frame
+                    # Розсилка у віртуальну камеру, прев'ю та інших підписників
+                    with tracer.span("bus_publish", frame_id):
+                        self.bus.publish(canvas, self.filters.content_rect, frame_id)
+                    tracer.frame_done(frame_id, started_ns)
 
             except TimeoutError:
                 pass
             except (ConnectionResetError, ValueError) as e:
                 print(f"[VideoMgr] Stream error: {e}")
                 client.close()
-                with self.lock:
-                    self.current_frame = None
+                self._clear_preview()
                 time.sleep(0.5)
             except Exception as e:
                 print(f"[VideoMgr] Unexpected error: {e}")
@@ -135,25 +235,14 @@ class VideoStreamHandler:
                 time.sleep(1.0)
 
         client.close()
-        self._close_virtual_cam()
-
-    def _rotate_image(self, frame, rotation):
-        if rotation == 90:
-            return cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-        elif rotation == 180:
-            return cv2.rotate(frame, cv2.ROTATE_180)
-        elif rotation == 270:
-            return cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        return frame
-
-    def _resize_contain(self, image, target_w, target_h):
-        """Змінює розмір зображення, зберігаючи пропорції, щоб воно вмістилось у цільові розміри."""
-        h, w = image.shape[:2]
 
-        # Розрахунок масштабу
-        scale = min(target_w / w, target_h / h)
-
-        new_w = int(w * scale)
-        new_h = int(h * scale)
-
-        return cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
\ No newline at end of file
+    def _send_quality_update(self, client):
+        if not self.quality_control_enabled:
+            return
+        update = self.quality.poll_update()
+        if update is None:
+            return
+        width, height, jpeg_quality, fps, keyframe = update
+        if not client.send_control(width, height, jpeg_quality, fps, keyframe):
+            # Не втрачаємо зміну параметрів: повторимо перед наступним кадром
+            self.quality.restore_update(update)